@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+import numpy as np
+
+from synthetic_data import generate_weather, file_month
+
+# Page of the clearinghouse before and after login (they must differ for 'PEMSConnector._setup_pems_connection')
+login_page = b"""<html><body><h1>PeMS Clearinghouse</h1>
+<form method="post" action="?dnode=Clearinghouse">
+<input type="text" name="username"><input type="password" name="password">
+<input type="submit" name="login" value="Login">
+</form></body></html>"""
+home_page = b"""<html><body><h1>PeMS Clearinghouse</h1><p>Logged in.</p></body></html>"""
+
+# Driving distances are the great-circle distance times a detour factor
+detour_factor = 1.2
+earth_radius_meters = 6371008.8
+
+
+class LocalServices:
+    def __init__(self, data_dir, host='127.0.0.1', port=0, latency=0.0, seed=0):
+        """
+        Local stand-ins for the PeMS clearinghouse, the OSRM route service and the weather API, served over HTTP
+        from a background thread so that the pipeline runs without credentials or network access.
+
+        Parameters:
+        - data_dir: Directory of the files served by the clearinghouse (as written by 'synthetic_data.write_dataset').
+        - host: Host to bind to.
+        - port: Port to bind to (0 picks a free port).
+        - latency: Delay (in seconds) added to every request, to mimic a remote service.
+        - seed: Random seed of the generated weather.
+
+        The URLs to use in the configuration are given by pems_url, osrm_url and weather_url.
+        """
+
+        self.data_dir, self.latency, self.seed = data_dir, latency, seed
+        self.requests = {'pems': 0, 'osrm': 0, 'weather': 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def pems_url(self):
+        return self.url + '/pems'
+
+    @property
+    def osrm_url(self):
+        return self.url + '/osrm/route/v1/driving/'
+
+    @property
+    def weather_url(self):
+        return self.url + '/weather'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def file_index(self, district, year, file_type):
+        """
+        Clearinghouse listing of the files of a type, district and year, grouped by month name.
+        """
+
+        directory = os.path.join(self.data_dir, file_type)
+        prefix = 'all_' if district == 'all' else f'd{int(district):02d}_'
+        index = {}
+        for file_name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+            file_year, month = file_month(file_name)
+            if file_name.startswith(prefix) and file_year == int(year):
+                url = f'/?srq=download&type={file_type}&file_name={file_name}'
+                index.setdefault(month, []).append({'file_name': file_name, 'url': url})
+        return index
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass # Keep the benchmark output clean
+
+            def send(self, body, content_type='application/json', status=200, headers=()):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for header in headers:
+                    self.send_header(*header)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                service = url.path.strip('/').split('/')[0]
+                if service in services.requests:
+                    services.requests[service] += 1
+                if services.latency:
+                    time.sleep(services.latency)
+
+                if service == 'pems':
+                    self.pems(parse_qs(url.query))
+                elif service == 'osrm':
+                    self.osrm(unquote(url.path.rsplit('/', 1)[-1]))
+                elif service == 'weather':
+                    _, location, start_date, end_date = unquote(url.path).strip('/').split('/')[:4]
+                    self.send(json.dumps(generate_weather(start_date, end_date, services.seed)).encode())
+                else:
+                    self.send(b'{}', status=404)
+
+            def do_POST(self):
+                # Login form of the clearinghouse: any credentials are accepted
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.send(home_page, 'text/html', headers=[('Set-Cookie', 'pems_session=local; Path=/')])
+
+            def pems(self, query):
+                request = query.get('srq', [None])[0]
+                if request == 'clearinghouse':
+                    index = services.file_index(query['district_id'][0], query['yy'][0], query['type'][0])
+                    self.send(json.dumps({'data': index} if index else {}).encode())
+                elif request == 'download':
+                    path = os.path.join(services.data_dir, query['type'][0], os.path.basename(query['file_name'][0]))
+                    with open(path, 'rb') as f:
+                        self.send(f.read(), 'application/octet-stream')
+                else:
+                    logged_in = 'pems_session=local' in self.headers.get('Cookie', '')
+                    self.send(home_page if logged_in else login_page, 'text/html')
+
+            def osrm(self, coordinates):
+                (start_lon, start_lat), (end_lon, end_lat) = [map(float, point.split(',')) for point in coordinates.split(';')]
+                start_lat, start_lon, end_lat, end_lon = np.radians([start_lat, start_lon, end_lat, end_lon])
+                a = np.sin((end_lat - start_lat) / 2) ** 2 + np.cos(start_lat) * np.cos(end_lat) * np.sin((end_lon - start_lon) / 2) ** 2
+                distance = detour_factor * 2 * earth_radius_meters * np.arcsin(np.sqrt(a))
+                self.send(json.dumps({'code': 'Ok', 'routes': [{'distance': float(distance)}]}).encode())
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve local stand-ins of the PeMS clearinghouse, OSRM and weather API.')
+    parser.add_argument('data_dir', help='directory of the synthetic dataset')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    services = LocalServices(args.data_dir, port=args.port)
+    print ('PeMS:', services.pems_url)
+    print ('OSRM:', services.osrm_url)
+    print ('Weather:', services.weather_url)
+    services.server.serve_forever()
@@ -0,0 +1,402 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+# Pipeline modules: data downloader, notebook helpers and the benchmark helpers
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+notebooks_dir = os.path.join(benchmarks_dir, '..', 'notebooks')
+sys.path[:0] = [benchmarks_dir, os.path.join(benchmarks_dir, '..', 'data_downloader'), notebooks_dir]
+os.environ.setdefault('MPLBACKEND', 'Agg') # model.ipynb imports matplotlib
+os.environ.setdefault('TQDM_DISABLE', '1') # Keep the benchmark output clean
+
+from synthetic_data import write_dataset
+from local_services import LocalServices
+from instrumentation import profiler
+from meta_lookup import load_meta_versions, asof_join_meta
+from analytics import haversine
+import data_downloader
+from db_operations import add_iso_timestamp, create_index, add_meta_validity, add_weather_data
+
+# Metric of every benchmark (higher is better) and its unit
+units = {
+    'download': 'files/s',
+    'ingestion': 'rows/s',
+    'features': 'rows/s',
+    'windows': 'samples/s',
+    'edges': 'stations/s',
+    'training_epoch': 'samples/s',
+    'evaluation': 'samples/s',
+    'inference': 'samples/s',
+    'dss_data': 'rows/s',
+    'dss_training': 'rows/s',
+}
+
+
+def write_config(path, services, data_path, db_path, start_date, end_date, district):
+    """
+    Write a data downloader configuration pointing to the local services.
+    """
+
+    config = f"""[Credentials]
+user = benchmark
+password = benchmark
+weather_api = benchmark
+
+[Paths]
+data_path = {data_path}
+pems_path = {services.pems_url}
+weather_path = {services.weather_url}
+db_path = {db_path}
+
+[BasicDetails]
+start_date = {start_date:%Y-%m-%d}
+end_date = {end_date:%Y-%m-%d}
+file_details = [(['{district}'],'meta'),(['{district}'],'station_5min'),(['all'],'chp_incidents_month')]
+weather_location = 33.742273,-117.83428
+weather_start_date = {start_date:%Y-%m-%d}
+weather_end_date = {end_date:%Y-%m-%d}
+"""
+    with open(path, 'w') as f:
+        f.write(config)
+
+
+def load_notebook(path, namespace):
+    """
+    Execute the code cells of a notebook into a namespace (cells with IPython magics are skipped).
+    """
+
+    with open(path) as f:
+        cells = json.load(f)['cells']
+
+    for cell in cells:
+        source = ''.join(cell['source'])
+        if cell['cell_type'] != 'code' or any(line.lstrip().startswith(('%', '!')) for line in source.splitlines()):
+            continue
+        exec(compile(source, path, 'exec'), namespace)
+
+    return namespace
+
+
+def load_features(conn, features, incident_radius_miles=1.0):
+    """
+    Build the model features from the database, in the shape produced by data_loader.ipynb.
+
+    Parameters:
+    - conn: A connection object to the SQLite database.
+    - features: Feature columns to build (Config.features).
+    - incident_radius_miles: Distance within which an active incident flags a station.
+
+    Returns:
+    - df: DataFrame of readings with station, iso_timestamp and the feature columns.
+    - meta_df: Latest version of each station (freeway_id, highway, freeway_direction, type, lanes, latitude, longitude).
+    """
+
+    df = pd.read_sql_query("SELECT station, iso_timestamp, total_flow, avg_speed, avg_occupancy FROM station_5min", conn)
+    meta_versions = load_meta_versions(conn, columns=['freeway', 'freeway_direction', 'type', 'lanes', 'latitude', 'longitude'])
+
+    # Mainline and HOV stations, with the lanes valid at each reading
+    meta_df = meta_versions.drop_duplicates('freeway_id', keep='last').rename(columns={'freeway': 'highway'})
+    meta_df = meta_df[meta_df['type'].isin(['ML', 'HV']) & meta_df['freeway_id'].isin(df['station'].unique())].reset_index(drop=True)
+    df = asof_join_meta(df[df['station'].isin(meta_df['freeway_id'])], meta_versions, columns=['lanes'])
+
+    # Temporal features
+    timestamps = pd.to_datetime(df['iso_timestamp'])
+    df['time'] = timestamps.dt.hour * 60 + timestamps.dt.minute
+    df['dow'] = timestamps.dt.dayofweek
+
+    # Hourly visibility
+    weather = pd.read_sql_query("SELECT datetime, visibility FROM weather", conn)
+    visibility = weather.set_index(pd.to_datetime(weather['datetime']))['visibility']
+    df['visibility'] = timestamps.dt.floor('h').map(visibility).to_numpy()
+
+    # Incidents active within the radius of a station
+    incidents = pd.read_sql_query("SELECT timestamp, duration, latitude, longitude FROM chp_incidents_month", conn)
+    df['incident_nearby'] = 0
+    if len(incidents):
+        start = pd.to_datetime(incidents['timestamp'], format='%m/%d/%Y %H:%M:%S').to_numpy()
+        end = start + pd.to_timedelta(incidents['duration'].fillna(0), unit='min').to_numpy()
+        distance = haversine(meta_df['latitude'].to_numpy()[:, None], meta_df['longitude'].to_numpy()[:, None],
+                             incidents['latitude'].to_numpy()[None], incidents['longitude'].to_numpy()[None])
+        station, incident = np.nonzero(distance <= incident_radius_miles)
+        pairs = pd.DataFrame({'station': meta_df['freeway_id'].to_numpy()[station], 'start': start[incident], 'end': end[incident]})
+        readings = df[['station']].assign(timestamp=timestamps.to_numpy()).reset_index().merge(pairs, on='station')
+        active = readings.loc[(readings['timestamp'] >= readings['start']) & (readings['timestamp'] < readings['end']), 'index'].unique()
+        df.loc[active, 'incident_nearby'] = 1
+
+    df = df[['station', 'iso_timestamp'] + [column for column in features if column not in ('station', 'iso_timestamp')]]
+
+    return df.dropna(subset=features).reset_index(drop=True), meta_df
+
+
+def record(results, name, items, throughput=None, **extra):
+    """
+    Add the timing and memory of a profiler stage to the results, with its throughput (items per second of the stage by default).
+    """
+
+    stage = profiler.stages[name]
+    results[name] = {
+        'seconds': stage['seconds'],
+        'items': int(items),
+        'unit': units[name],
+        'throughput': throughput or (items / stage['seconds'] if stage['seconds'] > 0 else None),
+        'peak_rss_mb': stage['peak_rss_mb'],
+        'peak_traced_increase_mb': stage.get('peak_traced_increase_mb'),
+        **extra,
+    }
+    print (f"{name:<16} {stage['seconds']:9.3f} s {results[name]['throughput'] or 0:14.1f} {units[name]}")
+
+
+def run_benchmarks(workdir, stations, days, start_date='2023-01-01', district=12, episodes=1, inference_repeats=50,
+                   skip_download=False, trace_memory=True, seed=0):
+    """
+    Run the pipeline end to end on a synthetic dataset and measure the throughput and memory of each stage.
+
+    Stages: download (through the local clearinghouse), ingestion into SQLite, feature loading, window building,
+    edge building (through the local OSRM service), one training epoch of the GAT model, evaluation,
+    single-timestep inference latency, DSS data creation and DSS training.
+
+    Parameters:
+    - workdir: Directory for the generated files, the downloaded files and the database.
+    - stations: Number of stations.
+    - days: Number of days (at least 8, the last week input needs one week of history).
+    - start_date: First day of the data (YYYY-MM-DD).
+    - district: District of the stations.
+    - episodes: Number of DSS training episodes.
+    - inference_repeats: Number of single-timestep batches timed for the inference latency.
+    - skip_download: If True, the generated files are ingested directly (no clearinghouse login or download).
+    - trace_memory: If True, the peak traced allocations of each stage are recorded (slower).
+    - seed: Random seed.
+
+    Returns:
+    - results: Dictionary with the run configuration, environment and the results of every benchmark.
+    """
+
+    import torch
+
+    if days < 8:
+        raise ValueError('At least 8 days are needed (the last week input needs one week of history)')
+
+    start_date = pd.Timestamp(start_date)
+    end_date = start_date + pd.Timedelta(days=days - 1)
+    source_dir = os.path.join(workdir, 'source')
+    data_path = source_dir if skip_download else os.path.join(workdir, 'download')
+    db_path = os.path.join(workdir, 'pems.db')
+    config_path = os.path.join(workdir, 'config.ini')
+    for path in (db_path, os.path.join(workdir, 'download')):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    generation_start = time.perf_counter()
+    summary = write_dataset(source_dir, stations, days, start_date, district, seed=seed)
+    generation_seconds = time.perf_counter() - generation_start
+
+    results = {}
+    with LocalServices(source_dir, seed=seed) as services:
+        write_config(config_path, services, data_path, db_path, start_date, end_date, district)
+        profiler.configure(enabled=True, trace_memory=trace_memory, report_dir=os.path.join(workdir, 'reports'))
+        pems = data_downloader.PEMSConnector(config_path, login=not skip_download)
+
+        # 1. Download through the local clearinghouse
+        if not skip_download:
+            with profiler.stage('download'):
+                pems._download_files()
+            record(results, 'download', sum(len(files) for _, _, files in os.walk(data_path)))
+
+        # 2. Ingestion into SQLite
+        with profiler.stage('ingestion'):
+            pems._create_table()
+            pems._insert_data()
+            add_iso_timestamp(pems.cursor, 'station_5min', 'timestamp')
+            create_index(pems.cursor, 'station_5min', 'iso_timestamp')
+            add_meta_validity(pems.cursor)
+            pems.conn.commit()
+            add_weather_data(config_path, pems.conn)
+        rows = pems.conn.execute("SELECT COUNT(*) FROM station_5min").fetchone()[0]
+        record(results, 'ingestion', rows)
+
+        # Model code and configuration of the notebooks
+        namespace = load_notebook(os.path.join(notebooks_dir, 'model.ipynb'), {'np': np, 'pd': pd, '__name__': '__main__'})
+        Config = namespace['Config']
+        Config.osrm_path = services.osrm_url
+        torch.manual_seed(seed)
+        np.random.seed(seed)
+
+        # 3. Features (in place of data_loader.ipynb) and standardisation as in main.ipynb
+        with profiler.stage('features'):
+            df, meta_df = load_features(pems.conn, Config.features)
+            df = df.sort_values(['iso_timestamp', 'station']).reset_index(drop=True)
+            train_length = int(len(df) * Config.train_size)
+            scaler = StandardScaler()
+            df[Config.features] = df[Config.features].astype(float)
+            scaler.fit(df.loc[:train_length - 1, Config.features])
+        namespace['scaler'] = scaler
+        record(results, 'features', len(df))
+        pems.conn.close()
+
+        # 4. Edge building (driving distances from the local OSRM service)
+        with profiler.stage('edges'):
+            nodes, node_index_map, index_node_map = namespace['create_nodes'](meta_df)
+            edges, edge_attributes = namespace['create_edge_and_attributes'](meta_df)
+        record(results, 'edges', len(nodes), edges=int(edge_attributes.shape[0]), osrm_requests=services.requests['osrm'])
+
+    # 5. Window building: panel and short-term graph windows (latest and last week inputs)
+    y_ts_start, y_ts_end, y_ts_step, output_channels = Config.create_y_range(pred_hour=0)
+    horizon_steps = list(range(y_ts_start, y_ts_end + y_ts_step, y_ts_step))
+    x_ranges = [Config.create_x_range(focus_timeframe=0), Config.create_x_range(focus_timeframe=2016)]
+    with profiler.stage('windows'):
+        panel = namespace['create_panel'](df, Config.features + Config.output, stations=nodes)
+        (graph_latest, graph_lastweek), graph_timestamp = namespace['create_windows'](panel, Config.features, Config.output, x_ranges, y_ts_start, y_ts_end, y_ts_step,
+                                                                                      edge_index=edges, edge_attributes=edge_attributes,
+                                                                                      fill=Config.fill_method, season_steps=Config.seasonal_lag, scaler=scaler)
+    record(results, 'windows', len(graph_latest))
+    del panel
+
+    # GAT model as in main.ipynb, trained on the same split as 'run_model'
+    design = Config.model_designs(len(nodes), output_channels, model_type='Graph', hidden_channels=Config.hidden_channels, graph_tf_nhead=Config.graph_tf_nhead)['GAT']
+    for i, data in enumerate((graph_latest, graph_lastweek)):
+        design[i]['in_channels'] = data[-1].x.shape[-1]
+    model = namespace['DualGAT_Trans'](model_params=design)
+    optimizer = torch.optim.Adam(model.parameters(), lr=Config.learning_rate)
+    criterion = torch.nn.MSELoss()
+
+    train_length = int(len(graph_latest) * Config.train_size)
+    samples = list(zip(graph_latest, graph_lastweek))
+    DataLoader = namespace['DataLoader']
+    train_loader = DataLoader(samples[:train_length], batch_size=Config.batch_size, shuffle=True)
+    test_loader = DataLoader(samples[train_length:], batch_size=Config.batch_size, shuffle=False)
+
+    # 6. One training epoch
+    with profiler.stage('training_epoch'):
+        loss = namespace['train_model'](model, train_loader, optimizer, criterion)
+    record(results, 'training_epoch', train_length, loss=loss)
+
+    # 7. Evaluation (predictions kept for the DSS)
+    with profiler.stage('evaluation'):
+        metrics, _, predictions, targets = namespace['evaluate_model'](model, test_loader, criterion, scaler, horizon_steps=horizon_steps, keep_predictions=True)
+    record(results, 'evaluation', len(samples) - train_length, mae=metrics['overall']['mae'])
+
+    # 8. Inference latency of a single timestep
+    model.eval()
+    latencies = []
+    with profiler.stage('inference'), torch.no_grad():
+        for i, batch in zip(range(inference_repeats), DataLoader(samples[train_length:], batch_size=1, shuffle=False)):
+            batch_start = time.perf_counter()
+            model(batch)
+            latencies.append(time.perf_counter() - batch_start)
+    latencies = np.array(latencies) * 1000
+    p50, p95 = np.percentile(latencies, [50, 95])
+    record(results, 'inference', len(latencies), throughput=1000 / p50, p50_ms=float(p50), p95_ms=float(p95)) # Samples per second at the median latency
+
+    # 9. DSS data: predictions per station and timestep, mapped to the nearest opposite station
+    with profiler.stage('dss_data'):
+        dss_df = namespace['create_rl_data'](predictions, targets, meta_df, index_node_map)
+        opp_dss_df = namespace['find_nearest_opposite_stations'](meta_df.reset_index(drop=True))
+        dss_df = namespace['map_opp_stations'](dss_df, opp_dss_df)
+        dss_df = dss_df[(dss_df['lanes'] > 1) & (dss_df['lanes_nearest_station'] > 1)].copy()
+        dss_df = dss_df[dss_df['timestep'] % 6 == 0]
+    record(results, 'dss_data', len(dss_df))
+
+    # 10. DSS training
+    with profiler.stage('dss_training'):
+        namespace['rl_model'](dss_df, episodes)
+    record(results, 'dss_training', len(dss_df) * episodes, episodes=episodes)
+
+    return {
+        'config': {'stations': stations, 'days': days, 'start_date': f'{start_date:%Y-%m-%d}', 'district': district, 'episodes': episodes,
+                   'inference_repeats': inference_repeats, 'skip_download': skip_download, 'trace_memory': trace_memory, 'seed': seed},
+        'dataset': {'readings': summary['readings'], 'incidents': summary['incidents'], 'nodes': len(nodes), 'samples': len(samples),
+                    'generation_seconds': generation_seconds},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+                        'numpy': np.__version__, 'pandas': pd.__version__, 'torch': torch.__version__, 'torch_threads': torch.get_num_threads()},
+        'benchmarks': results,
+        'run': profiler.report(),
+    }
+
+
+def compare(results, baseline, tolerance=0.2, memory_slack_mb=1.0):
+    """
+    Compare the results of a run with a baseline run.
+
+    A benchmark regresses when its throughput drops by more than the tolerance, or when its peak traced memory
+    grows by more than the tolerance (plus a small absolute slack, as small stages are noisy).
+
+    Parameters:
+    - results: Results of 'run_benchmarks'.
+    - baseline: Results of an earlier run with the same configuration.
+    - tolerance: Relative change allowed (0.2 = 20%).
+    - memory_slack_mb: Absolute memory growth always allowed (MB).
+
+    Returns:
+    - comparison: DataFrame with one row per benchmark and metric, and a regression flag.
+    """
+
+    rows = []
+    for name, current in results['benchmarks'].items():
+        previous = baseline['benchmarks'].get(name)
+        if previous is None:
+            continue
+
+        if current['throughput'] and previous['throughput']:
+            change = current['throughput'] / previous['throughput'] - 1
+            rows.append((name, current['unit'], previous['throughput'], current['throughput'], change, change < -tolerance))
+
+        if current.get('peak_traced_increase_mb') is not None and previous.get('peak_traced_increase_mb') is not None:
+            change = current['peak_traced_increase_mb'] / max(previous['peak_traced_increase_mb'], 1e-9) - 1
+            limit = previous['peak_traced_increase_mb'] * (1 + tolerance) + memory_slack_mb
+            rows.append((name, 'traced MB', previous['peak_traced_increase_mb'], current['peak_traced_increase_mb'], change,
+                         current['peak_traced_increase_mb'] > limit))
+
+    return pd.DataFrame(rows, columns=['benchmark', 'metric', 'baseline', 'current', 'change', 'regression'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='End-to-end pipeline benchmarks on a synthetic PeMS dataset.')
+    parser.add_argument('--stations', type=int, default=100, help='number of stations')
+    parser.add_argument('--days', type=int, default=10, help='number of days (at least 8)')
+    parser.add_argument('--start-date', default='2023-01-01', help='first day (YYYY-MM-DD)')
+    parser.add_argument('--episodes', type=int, default=1, help='DSS training episodes')
+    parser.add_argument('--inference-repeats', type=int, default=50, help='single-timestep batches timed for the inference latency')
+    parser.add_argument('--skip-download', action='store_true', help='ingest the generated files directly, without the local clearinghouse')
+    parser.add_argument('--no-trace-memory', action='store_true', help='do not record the traced memory of each stage (faster)')
+    parser.add_argument('--workdir', help='working directory (a temporary directory is used and removed by default)')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON file to which the results are written')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative throughput drop (or memory growth) flagged as a regression')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='pems_benchmark_')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        results = run_benchmarks(workdir, args.stations, args.days, args.start_date, episodes=args.episodes, inference_repeats=args.inference_repeats,
+                                 skip_download=args.skip_download, trace_memory=not args.no_trace_memory, seed=args.seed)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, default=str)
+    print ('Benchmark results written to', args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['config'] != results['config']:
+            print ('Warning: the baseline was run with a different configuration', baseline['config'])
+
+        comparison = compare(results, baseline, args.tolerance)
+        print (comparison.to_string(index=False, float_format=lambda value: f'{value:.3f}'))
+        if comparison['regression'].any():
+            print ('Regressions:', ', '.join(comparison.loc[comparison['regression'], 'benchmark'].unique()))
+            sys.exit(1)
+        print ('No regressions (tolerance', f'{args.tolerance:.0%})')
@@ -0,0 +1,341 @@
+import os
+import re
+import gzip
+import zipfile
+import argparse
+import calendar
+import numpy as np
+import pandas as pd
+
+# Centre of the generated region (Orange County, district 12) and spacing of the stations along a freeway
+region_centre = (33.742273, -117.83428)
+station_spacing_miles = 0.5
+miles_per_degree = 69.0
+
+# Freeways of the generated region: number, directions and bearing (degrees from north)
+freeways = [(5, ('N', 'S'), 135), (55, ('N', 'S'), 170), (405, ('N', 'S'), 120), (22, ('E', 'W'), 80), (91, ('E', 'W'), 95), (57, ('N', 'S'), 10)]
+
+# Lane types and their share of the stations
+lane_types = (['ML', 'HV', 'OR', 'FR'], [0.7, 0.1, 0.1, 0.1])
+
+# Weather conditions and their visibility (miles)
+weather_conditions = [('Clear', 9.9), ('Partially cloudy', 9.9), ('Overcast', 8.0), ('Rain', 4.0), ('Rain, Overcast', 3.0), ('Fog', 1.0)]
+
+
+def generate_stations(num_stations, district=12, seed=0):
+    """
+    Generate station metadata: stations placed every half mile along both directions of a few freeways.
+
+    Parameters:
+    - num_stations: Number of stations.
+    - district: District of the stations.
+    - seed: Random seed.
+
+    Returns:
+    - meta: DataFrame with one row per station, in the column order of the PeMS meta files.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    # Spread the stations over the freeways, both directions of a freeway getting the same number of stations
+    per_direction = np.full(len(freeways), num_stations // (2 * len(freeways)))
+    per_direction[:(num_stations // 2) % len(freeways)] += 1
+
+    rows = []
+    for (freeway, directions, bearing), count in zip(freeways, per_direction):
+        # Position of the stations along the freeway, centred on the region
+        offsets = (np.arange(count) - count / 2) * station_spacing_miles
+        angle = np.radians(bearing)
+        latitude = region_centre[0] + offsets * np.cos(angle) / miles_per_degree + rng.normal(0, 0.002)
+        longitude = region_centre[1] + offsets * np.sin(angle) / (miles_per_degree * np.cos(np.radians(region_centre[0])))
+
+        for side, direction in enumerate(directions):
+            # Opposite directions are a few metres apart
+            shift = (0.0002 if side else -0.0002)
+            for i in range(count):
+                rows.append({'freeway': freeway, 'freeway_direction': direction, 'state_pm': round(offsets[i] - offsets[0], 3),
+                             'latitude': round(latitude[i] + shift, 6), 'longitude': round(longitude[i] - shift, 6)})
+
+    # Odd number of stations: add the last one to the first freeway
+    while len(rows) < num_stations:
+        rows.append(dict(rows[-1], latitude=rows[-1]['latitude'] + 0.003))
+
+    meta = pd.DataFrame(rows[:num_stations])
+    meta.insert(0, 'freeway_id', district * 100000 + 1000 + np.arange(len(meta)))
+    meta.insert(3, 'district', district)
+    meta.insert(4, 'county', 59)
+    meta.insert(5, 'city', '')
+    meta.insert(7, 'absolute_pm', (meta['state_pm'] + 10).round(3))
+    meta['length'] = station_spacing_miles
+    meta['type'] = rng.choice(lane_types[0], size=len(meta), p=lane_types[1])
+    meta['lanes'] = np.where(meta['type'] == 'ML', rng.integers(2, 7, size=len(meta)), rng.integers(1, 3, size=len(meta)))
+    meta['name'] = [f'Station {i}' for i in range(len(meta))]
+    meta['user_id1'], meta['user_id2'], meta['user_id3'] = '', '', ''
+
+    return meta
+
+
+def change_stations(meta, fraction=0.02, seed=0):
+    """
+    Create a new version of the station metadata where a fraction of the stations changed their number of lanes.
+    """
+
+    rng = np.random.default_rng(seed)
+    meta = meta.copy()
+    changed = rng.random(len(meta)) < fraction
+    meta.loc[changed, 'lanes'] = np.clip(meta.loc[changed, 'lanes'] + rng.choice([-1, 1], size=changed.sum()), 1, 6)
+
+    return meta
+
+
+def generate_incidents(meta, start_date, days, rate_per_day=2.0, seed=0):
+    """
+    Generate CHP incidents near random stations.
+
+    Parameters:
+    - meta: Station metadata from 'generate_stations'.
+    - start_date: First day (string or datetime).
+    - days: Number of days.
+    - rate_per_day: Average number of incidents per day for every 100 stations.
+    - seed: Random seed.
+
+    Returns:
+    - incidents: DataFrame with one row per incident, in the column order of the PeMS CHP incident files.
+    """
+
+    rng = np.random.default_rng(seed)
+    count = rng.poisson(rate_per_day * days * max(1, len(meta)) / 100)
+    station = meta.iloc[rng.integers(0, len(meta), size=count)].reset_index(drop=True)
+    timestamp = pd.Timestamp(start_date) + pd.to_timedelta(rng.uniform(0, days * 24 * 60, size=count).round(), unit='min')
+
+    incidents = pd.DataFrame({
+        'incident_id': 10000000 + np.arange(count),
+        'cc_code': 'BCCC',
+        'incident_no': rng.integers(1, 2000, size=count),
+        'timestamp': timestamp.strftime('%m/%d/%Y %H:%M:%S'),
+        'description': rng.choice(['1182-Trfc Collision-No Inj', '1183-Trfc Collision-Unkn Inj', '1125-Traffic Hazard'], size=count),
+        'location': [f"{freeway} {direction} At Station" for freeway, direction in zip(station['freeway'], station['freeway_direction'])],
+        'area': 'Santa Ana',
+        'zoom_map': '',
+        'tb_xy': '',
+        'latitude': (station['latitude'] + rng.normal(0, 0.001, size=count)).round(6),
+        'longitude': (station['longitude'] + rng.normal(0, 0.001, size=count)).round(6),
+        'district': station['district'],
+        'county_id': station['county'],
+        'city_id': '',
+        'freeway_no': station['freeway'],
+        'freeway_direction': station['freeway_direction'],
+        'state_pm': station['state_pm'],
+        'absolute_pm': station['absolute_pm'],
+        'severity': '',
+        'duration': rng.gamma(2.0, 20.0, size=count).round(),
+    })
+
+    return incidents
+
+
+def daily_profile(minutes, weekend):
+    """
+    Flow per lane and 5-minute interval at the given minutes of the day: morning and evening peaks on weekdays,
+    a single midday peak on weekends.
+    """
+
+    hours = minutes / 60
+    if weekend:
+        return 15 + 75 * np.exp(-((hours - 14) / 4) ** 2)
+    return 15 + 95 * np.exp(-((hours - 8) / 1.5) ** 2) + 105 * np.exp(-((hours - 17.5) / 2) ** 2) + 45 * np.exp(-((hours - 12.5) / 3) ** 2)
+
+
+def generate_station_5min(meta, day, incidents=None, missing_rate=0.01, data_interval_mins=5, seed=0):
+    """
+    Generate one day of 5-minute station readings.
+
+    Parameters:
+    - meta: Station metadata from 'generate_stations'.
+    - day: The day (string or datetime).
+    - incidents: Optional, incidents from 'generate_incidents'. The flow and speed of the nearest station drop during an incident.
+    - missing_rate: Fraction of the readings missing at random (each station also has a 1% chance of a one hour outage).
+    - data_interval_mins: The interval (in minutes) between readings.
+    - seed: Random seed.
+
+    Returns:
+    - readings: List of rows in the format of the PeMS station_5min files (with one group of 5 columns per lane).
+    """
+
+    day = pd.Timestamp(day).normalize()
+    rng = np.random.default_rng([seed, day.toordinal()])
+    minutes = np.arange(0, 24 * 60, data_interval_mins)
+    num_steps, num_stations = len(minutes), len(meta)
+    lanes = meta['lanes'].to_numpy()
+
+    # Expected flow per lane: daily profile, with the morning peak on N/E and the evening peak on S/W directions
+    weekend = day.dayofweek >= 5
+    profile = daily_profile(minutes, weekend)[:, None]
+    inbound = meta['freeway_direction'].isin(['N', 'E']).to_numpy()
+    tilt = np.where(inbound, 1.0, 0.85) + np.where(inbound, 0.15, -0.15) * np.cos(np.pi * minutes / 720)[:, None]
+    station_scale = np.random.default_rng([seed, 1]).uniform(0.6, 1.3, size=num_stations)
+    type_scale = np.where(meta['type'].to_numpy() == 'ML', 1.0, 0.35)
+    expected = profile * tilt * station_scale * type_scale
+
+    # Incidents reduce the capacity of the nearest station while they last
+    capacity = np.ones((num_steps, num_stations))
+    if incidents is not None and len(incidents):
+        start = pd.to_datetime(incidents['timestamp'], format='%m/%d/%Y %H:%M:%S')
+        today = (start >= day) & (start < day + pd.Timedelta(days=1))
+        for _, incident in incidents[today].iterrows():
+            nearest = np.argmin((meta['latitude'] - incident['latitude']) ** 2 + (meta['longitude'] - incident['longitude']) ** 2)
+            begin = (pd.Timestamp(incident['timestamp']) - day) // pd.Timedelta(minutes=data_interval_mins)
+            capacity[begin:begin + int(incident['duration'] // data_interval_mins) + 1, nearest] = 0.5
+
+    # Flow per lane, occupancy and speed (speed drops once occupancy passes the critical value)
+    lane_flow = rng.poisson(expected * capacity)
+    occupancy = np.clip(lane_flow / 1500 + rng.normal(0, 0.005, size=lane_flow.shape) + (1 - capacity) * 0.15, 0.001, 0.95)
+    speed = np.clip(70 - 180 * np.maximum(occupancy - 0.08, 0) + rng.normal(0, 1.5, size=lane_flow.shape), 5, 80)
+    total_flow = lane_flow * lanes
+
+    # Missing readings: at random and one hour outages
+    observed = rng.random((num_steps, num_stations)) >= missing_rate
+    outage = rng.random(num_stations) < 0.01
+    outage_start = rng.integers(0, num_steps - 12, size=num_stations)
+    for station in np.flatnonzero(outage):
+        observed[outage_start[station]:outage_start[station] + 12, station] = False
+
+    # Rows in the order of the PeMS files: timestamp, station, district, freeway, direction, lane type, station length,
+    # samples, % observed, total flow, avg occupancy, avg speed, then per lane: samples, flow, avg occupancy, avg speed, observed
+    timestamps = (day + pd.to_timedelta(minutes, unit='min')).strftime('%m/%d/%Y %H:%M:%S')
+    stations = meta[['freeway_id', 'district', 'freeway', 'freeway_direction', 'type', 'length']].astype(str).to_numpy()
+    readings = []
+    for t, station in zip(*np.nonzero(observed)):
+        row = [timestamps[t], *stations[station], str(10 * lanes[station]), '100',
+               str(total_flow[t, station]), f'{occupancy[t, station]:.4f}', f'{speed[t, station]:.1f}']
+        lane_speed = f'{speed[t, station]:.1f}'
+        lane_occupancy = f'{occupancy[t, station]:.4f}'
+        for lane in range(lanes[station]):
+            row += ['10', str(lane_flow[t, station]), lane_occupancy, lane_speed, '1']
+        readings.append(row)
+
+    return readings
+
+
+def generate_weather(start_date, end_date, seed=0):
+    """
+    Generate hourly weather in the format of the weather API timeline response.
+
+    Parameters:
+    - start_date: First day (string or datetime).
+    - end_date: Last day (string or datetime), included.
+    - seed: Random seed.
+
+    Returns:
+    - weather_data: Dictionary with one entry per day, each with 24 hourly records.
+    """
+
+    days = pd.date_range(pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize(), freq='D')
+    rng = np.random.default_rng([seed, 2])
+
+    weather_data = {'days': []}
+    for day in days:
+        # One condition per day, temperature following the time of day
+        condition, visibility = weather_conditions[rng.choice(len(weather_conditions), p=[0.45, 0.25, 0.12, 0.1, 0.05, 0.03])]
+        hours = []
+        for hour in range(24):
+            hours.append({
+                'datetime': f'{hour:02d}:00:00',
+                'datetimeEpoch': int((day + pd.Timedelta(hours=hour)).timestamp()),
+                'temp': round(14 + 7 * np.sin((hour - 9) * np.pi / 12) + rng.normal(0, 1), 1),
+                'humidity': round(rng.uniform(40, 90), 1),
+                'precip': round(rng.uniform(0, 2), 2) if 'Rain' in condition else 0.0,
+                'preciptype': ['rain'] if 'Rain' in condition else None,
+                'windspeed': round(rng.uniform(0, 20), 1),
+                'visibility': round(max(0.1, visibility + rng.normal(0, 0.3)), 1),
+                'conditions': condition,
+                'stations': ['KSNA'],
+            })
+        weather_data['days'].append({'datetime': day.strftime('%Y-%m-%d'), 'hours': hours})
+
+    return weather_data
+
+
+def write_dataset(output_dir, num_stations, days, start_date='2023-01-01', district=12, missing_rate=0.01, incident_rate=2.0, seed=0):
+    """
+    Write a synthetic dataset in the file formats read by 'PEMSConnector._insert_data' (output_dir can be used as data_path).
+
+    The following files are written:
+    1. meta: tab separated text files with a header, one for the previous year and one for the start date (some lanes changed).
+    2. station_5min: gzipped comma separated files without header, one per day.
+    3. chp_incidents_month: zipped tab separated text files without header, one per month.
+
+    Parameters:
+    - output_dir: Directory in which the files are written (in one sub-directory per file type).
+    - num_stations: Number of stations.
+    - days: Number of days.
+    - start_date: First day of the data (YYYY-MM-DD).
+    - district: District of the stations.
+    - missing_rate: Fraction of the readings missing at random.
+    - incident_rate: Average number of incidents per day for every 100 stations.
+    - seed: Random seed.
+
+    Returns:
+    - summary: Dictionary with the number of stations, readings and incidents and the list of written files.
+    """
+
+    start_date = pd.Timestamp(start_date)
+    files = []
+    for file_type in ('meta', 'station_5min', 'chp_incidents_month'):
+        os.makedirs(os.path.join(output_dir, file_type), exist_ok=True)
+
+    # Station metadata: a version from the previous year and the current version
+    meta = generate_stations(num_stations, district, seed)
+    previous_date = pd.Timestamp(year=start_date.year - 1, month=12, day=1)
+    header = ['ID', 'Fwy', 'Dir', 'District', 'County', 'City', 'State_PM', 'Abs_PM', 'Latitude', 'Longitude',
+              'Length', 'Type', 'Lanes', 'Name', 'User_ID_1', 'User_ID_2', 'User_ID_3']
+    for version_date, version in ((previous_date, change_stations(meta, seed=seed + 1)), (start_date, meta)):
+        path = os.path.join(output_dir, 'meta', f'd{district:02d}_text_meta_{version_date:%Y_%m_%d}.txt')
+        version.to_csv(path, sep='\t', header=header, index=False)
+        files.append(path)
+
+    # Incidents, one file per month
+    incidents = generate_incidents(meta, start_date, days, incident_rate, seed)
+    months = pd.to_datetime(incidents['timestamp'], format='%m/%d/%Y %H:%M:%S').dt.to_period('M')
+    for month in pd.period_range(start_date, start_date + pd.Timedelta(days=days - 1), freq='M'):
+        name = f'all_text_chp_incidents_month_{month.year}_{month.month:02d}'
+        path = os.path.join(output_dir, 'chp_incidents_month', name + '.zip')
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as f:
+            f.writestr(name + '.txt', incidents[months == month].to_csv(sep='\t', header=False, index=False))
+        files.append(path)
+
+    # Station readings, one file per day
+    readings = 0
+    for day in pd.date_range(start_date, periods=days, freq='D'):
+        rows = generate_station_5min(meta, day, incidents, missing_rate, seed=seed)
+        path = os.path.join(output_dir, 'station_5min', f'd{district:02d}_text_station_5min_{day:%Y_%m_%d}.txt.gz')
+        with gzip.open(path, 'wt') as f:
+            f.write('\n'.join(','.join(row) for row in rows) + '\n')
+        readings += len(rows)
+        files.append(path)
+
+    print ('Synthetic Dataset Created!', num_stations, 'stations,', days, 'days,', readings, 'readings,', len(incidents), 'incidents')
+
+    return {'stations': num_stations, 'days': days, 'readings': readings, 'incidents': len(incidents), 'files': files}
+
+
+def file_month(file_name):
+    """
+    Year and month name of a generated file (from the YYYY_MM in its name), as used by the clearinghouse file listing.
+    """
+
+    year, month = re.search(r'(\d{4})_(\d{2})', file_name).groups()
+    return int(year), calendar.month_name[int(month)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic PeMS dataset (meta, station_5min, chp_incidents_month).')
+    parser.add_argument('output_dir', help='directory in which the files are written')
+    parser.add_argument('--stations', type=int, default=100, help='number of stations')
+    parser.add_argument('--days', type=int, default=14, help='number of days')
+    parser.add_argument('--start-date', default='2023-01-01', help='first day (YYYY-MM-DD)')
+    parser.add_argument('--missing-rate', type=float, default=0.01, help='fraction of readings missing at random')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+
+    write_dataset(args.output_dir, args.stations, args.days, args.start_date, missing_rate=args.missing_rate, seed=args.seed)
@@ -16,17 +16,51 @@ import ast
 import sqlite3
 import gzip
 import csv
+import re
 from datetime import datetime
-from db_operations import table_data, is_header, get_column_names, add_iso_timestamp, create_index, add_weather_data
+from contextlib import nullcontext
+from db_operations import table_data, is_header, get_column_names, add_iso_timestamp, create_index, add_meta_validity, add_weather_data
+
+# Pipeline instrumentation (optional: notebooks/instrumentation.py must be importable, e.g. PYTHONPATH=notebooks)
+try:
+    from instrumentation import profiler
+    instrumentation_available = True
+except ImportError:
+    instrumentation_available = False
+
+    class NullProfiler:
+        """
+        No-op stand-in for 'instrumentation.profiler' when the module is not importable.
+        """
+
+        enabled = False
+
+        def configure(self, *args, **kwargs):
+            return self
+
+        def stage(self, name):
+            return nullcontext()
+
+        def timed(self, name=None):
+            return lambda function: function
+
+        def count(self, name, value=1):
+            pass
+
+        def write_report(self, name='pipeline'):
+            return None
+
+    profiler = NullProfiler()
 
 class PEMSConnector:
-    def __init__(self, config_file, debug=False):
+    def __init__(self, config_file, debug=False, login=True):
         """
         Initialize the PEMSConnector with configuration details and set up the connection to PeMS.
         
         Args:
             config_file (str): Path to the configuration file.
             debug (bool): Enable debug logging if True.
+            login (bool): Log in to PeMS if True. Without login, only the downloaded files can be inserted.
         """
         
         # Initialize with configuration file path
@@ -41,6 +75,9 @@ class PEMSConnector:
         # Paths for various files
         self.data_path = self.config['Paths']['data_path']
 
+        # PeMS website (can point to a local stand-in, see benchmarks/local_services.py)
+        self.base_url = self.config.get('Paths', 'pems_path', fallback='http://pems.dot.ca.gov').rstrip('/')
+
         # About data
         self.start_date = str(self.config['BasicDetails']['start_date'])
         self.end_date = str(self.config['BasicDetails']['end_date'])
@@ -53,10 +90,12 @@ class PEMSConnector:
 
         self.debug = debug
         self.log = logging.getLogger(__name__)
+
         # Login to website 
-        self.browser = self._setup_pems_connection() 
+        self.browser = self._setup_pems_connection() if login else None
  
 
+    @profiler.timed('login')
     def _setup_pems_connection(self, retries=3):
 
         """
@@ -72,7 +111,7 @@ class PEMSConnector:
         """
 
         # Base URL of the PeMS website
-        base_url = 'http://pems.dot.ca.gov'
+        base_url = self.base_url
         login_url = f"{base_url}/?dnode=Clearinghouse" # URL for the login page
 
         # Create a Browser object from mechanize
@@ -174,7 +213,62 @@ class PEMSConnector:
             current_year += 1
 
         return date_range
-    
+
+    @staticmethod
+    def get_meta_file_date(file_name):
+        """
+        Extracts the date a meta file applies from, based on its file name.
+
+        Parameters:
+        - file_name (str): Meta file name, e.g. 'd12_text_meta_2023_01_15.txt'.
+
+        Returns:
+        - str: Date in 'YYYY-MM-DD HH:MM:SS' format, comparable with the iso_timestamp column.
+        """
+
+        # Meta files are named with the date they were published on
+        match = re.search(r'(\d{4})_(\d{2})_(\d{2})', file_name)
+        if match is None:
+            raise ValueError(f'Unable to find the date in meta file name {file_name}')
+
+        return '{}-{}-{} 00:00:00'.format(*match.groups())
+
+    def _version_meta_rows(self, rows, file_name, row_length, meta_versions):
+        """
+        Converts the rows of one meta file into station versions valid from the file date.
+
+        Rows of stations whose attributes did not change since their previous version are skipped,
+        so that each stored row marks the start of a new validity interval. The end of the interval
+        (valid_to) is filled in after all files are inserted, see `add_meta_validity`.
+
+        Parameters:
+        - rows (list): Data rows read from the meta file.
+        - file_name (str): Name of the meta file the rows were read from.
+        - row_length (int): Number of meta attribute columns.
+        - meta_versions (dict): Latest version of each station seen so far, updated in place.
+
+        Returns:
+        - list: Rows to insert, with valid_from and valid_to appended.
+        """
+
+        valid_from = self.get_meta_file_date(file_name)
+        versioned_rows = []
+
+        for row in rows:
+            # Pad short rows so that the validity columns line up
+            row = row + ['']*(row_length-len(row))
+
+            # Skip the row if the station attributes did not change
+            station = row[0]
+            if meta_versions.get(station) == row:
+                continue
+            meta_versions[station] = row
+
+            versioned_rows.append(row + [valid_from, None])
+
+        return versioned_rows
+
+    @profiler.timed('download')
     def _download_files(self):
 
         """
@@ -198,12 +292,14 @@ class PEMSConnector:
         for year, (districts, file_type) in itertools.product(sorted(date_range.keys()), self.file_details):
             for district in districts:
                 # Construct the URL for the data file
-                file_url = "http://pems.dot.ca.gov/?srq=clearinghouse&district_id={}&yy={}&type={}&returnformat=text".format(district, str(year), file_type)
+                file_url = "{}/?srq=clearinghouse&district_id={}&yy={}&type={}&returnformat=text".format(self.base_url, district, str(year), file_type)
                 print (file_url) # Print the URL for debugging purposes
                 
                 # Open the URL and read the response
-                self.browser.open(file_url)
-                target_data = json.loads(self.browser.response().read()) # Parse the JSON response
+                with profiler.stage('file_index'):
+                    self.browser.open(file_url)
+                    target_data = json.loads(self.browser.response().read()) # Parse the JSON response
+                profiler.count('download.index_requests')
                 if 'data' in target_data:
                     target_data =target_data['data']
 
@@ -222,9 +318,11 @@ class PEMSConnector:
                     
                     while old_meta_added==False:
                         start_year = start_year-1
-                        file_url = "http://pems.dot.ca.gov/?srq=clearinghouse&district_id={}&yy={}&type={}&returnformat=text".format(district, str(start_year), file_type)
-                        self.browser.open(file_url)
-                        target_data = json.loads(self.browser.response().read())
+                        file_url = "{}/?srq=clearinghouse&district_id={}&yy={}&type={}&returnformat=text".format(self.base_url, district, str(start_year), file_type)
+                        with profiler.stage('file_index'):
+                            self.browser.open(file_url)
+                            target_data = json.loads(self.browser.response().read())
+                        profiler.count('download.index_requests')
                         
                         if 'data' in target_data:
                             target_data =target_data['data']
@@ -249,15 +347,17 @@ class PEMSConnector:
             
                 for _, file in downloadable_data_dummy.iterrows():
                     file_name = file['file_name']
-                    base_url = 'http://pems.dot.ca.gov'
-                    file_url = base_url+file['url']
+                    file_url = self.base_url+file['url']
                     download_path = os.path.join(save_path, file_name)
                 
                     
                     try:
                         self.log.info('Start download, {}'.format(file_name))
 
-                        self.browser.retrieve(file_url, download_path)
+                        with profiler.stage('retrieve'):
+                            self.browser.retrieve(file_url, download_path)
+                        profiler.count('download.files')
+                        profiler.count('download.bytes', os.path.getsize(download_path))
                         self.log.info('Download completed, {}'.format(file_name))
                         print ('Download completed, {}'.format(file_name))
 
@@ -280,6 +380,7 @@ class PEMSConnector:
         cursor = self.conn.cursor()
         return cursor
     
+    @profiler.timed('create_tables')
     def _create_table(self):
         """
         Creates database tables as defined in the `table_data` function from `ddl` module.
@@ -290,6 +391,7 @@ class PEMSConnector:
             self.conn.commit()
             print ('Table Created Successfully')
 
+    @profiler.timed('insert')
     def _insert_data(self):
 
         """
@@ -307,6 +409,10 @@ class PEMSConnector:
         """
         # Get the list of file types from configuration
         file_types = [item[1] for item in self.file_details]
+
+        # Latest version of each station, used to store only the meta rows that changed
+        meta_versions = {}
+
         for file_type in file_types:
             # List and sort files of the current type in the data directory
             file_list = os.listdir(os.path.join(self.data_path, file_type))
@@ -314,6 +420,9 @@ class PEMSConnector:
 
             # Get column names for the current file type
             column_list = get_column_names(self.conn, file_type)
+
+            # Number of columns read from the files (meta validity columns are derived, not read)
+            row_length = len([column for column in column_list[1:] if column not in ('valid_from', 'valid_to')])
             
             for file in file_list:
                 # Open the file and create a list of data rows
@@ -328,64 +437,73 @@ class PEMSConnector:
                     os.makedirs(extraction_dir, exist_ok=True)
 
                     # Unzip the file
-                    with zipfile.ZipFile(file_path, 'r') as f:
+                    with profiler.stage('extract'), zipfile.ZipFile(file_path, 'r') as f:
                         f.extractall(extraction_dir)
 
-                    # List the extracted files and select the one matching the file_type
-                    extracted_files = os.listdir(extraction_dir)
+                        # List the files extracted from this archive and select the one matching the file_type
+                        extracted_files = f.namelist()
                     file = [file for file in extracted_files if file_type in file][0]
                     file_path = extraction_dir+'/'+file
                     print("Extracted file:", file)
 
-                # Check if the file is GZIP compressed
-                if '.gz' in file: 
-                    with gzip.open(file_path, 'rt') as f:
-                        # Assume the file contains CSV data
-                        csv_reader = csv.DictReader(f)
-                        csv_reader = csv.reader(f)
-                        try:
-                            count = 0
-                            for row in csv_reader:
-                                count = count+1
-                                # Skip header row
-                                if is_header(row) and count==1:
-                                    continue
-                                # Append data row to list
-                                data_to_insert.append(row[:len(column_list[1:])])
+                # Read the data rows of the file
+                with profiler.stage('parse'):
+                    # Check if the file is GZIP compressed
+                    if '.gz' in file: 
+                        with gzip.open(file_path, 'rt') as f:
+                            # Assume the file contains CSV data
+                            csv_reader = csv.DictReader(f)
+                            csv_reader = csv.reader(f)
+                            try:
+                                count = 0
+                                for row in csv_reader:
+                                    count = count+1
+                                    # Skip header row
+                                    if is_header(row) and count==1:
+                                        continue
+                                    # Append data row to list
+                                    data_to_insert.append(row[:row_length])
                                 
-                        except:
-                            print ('Unable to expand',f,'into data')
-
-                # Check if the file is a text file
-                elif '.txt' in file:
-                    with open(file_path, 'rt') as f:
-                        csv_reader = csv.reader(f, delimiter='\t')
-                        try:
-                            count = 0
-                            for row in csv_reader:
-                                count = count+1
-                                # Skip header row
-                                if is_header(row) and count==1:
-                                    continue
-                                # Append data row to list
-                                data_to_insert.append(row[:len(column_list[1:])])
+                            except:
+                                print ('Unable to expand',f,'into data')
+
+                    # Check if the file is a text file
+                    elif '.txt' in file:
+                        with open(file_path, 'rt') as f:
+                            csv_reader = csv.reader(f, delimiter='\t')
+                            try:
+                                count = 0
+                                for row in csv_reader:
+                                    count = count+1
+                                    # Skip header row
+                                    if is_header(row) and count==1:
+                                        continue
+                                    # Append data row to list
+                                    data_to_insert.append(row[:row_length])
                                 
-                        except:
-                            print ('Unable to expand',f,'into data')
+                            except:
+                                print ('Unable to expand',f,'into data')
                 
-                else:
-                    # Skip unsupported file types
-                    continue
+                    else:
+                        # Skip unsupported file types
+                        continue
+
+                # Keep only the changed station rows of meta files, along with their validity
+                if file_type == 'meta':
+                    data_to_insert = self._version_meta_rows(data_to_insert, file, row_length, meta_versions)
 
                 # Create the SQL INSERT statement with placeholders for the data
                 insert_query = "INSERT INTO "+file_type+" ("+ ','.join(column_list[1:])+") VALUES ("+','.join(['?']*len(column_list[1:]))+")"
                 print (len(data_to_insert))
 
                 # Execute the INSERT statement for all data rows
-                self.conn.executemany(insert_query, data_to_insert)
+                with profiler.stage('write'):
+                    self.conn.executemany(insert_query, data_to_insert)
 
-                # Commit the transaction to save changes to the database
-                self.conn.commit()
+                    # Commit the transaction to save changes to the database
+                    self.conn.commit()
+                profiler.count(f'insert.{file_type}_files')
+                profiler.count(f'insert.{file_type}_rows', len(data_to_insert))
                 print("Data inserted successfully!", file)
             
     def close_conn(self):
@@ -406,10 +524,21 @@ if __name__ == "__main__":
     1. Create an instance of PEMSConnector with the configuration file.
     2. Perform data download and table creation.
     3. Insert data into the database.
-    4. Add weather data to the database.
-    5. Close the database connection.
+    4. Add validity intervals to the station metadata.
+    5. Add weather data to the database.
+    6. Close the database connection and write the run report (if instrumentation is enabled).
     """
 
+    # Stage timers and counters of this run (disabled unless set in the configuration file)
+    config = configparser.ConfigParser()
+    config.read("config.ini")
+    if config.getboolean('Instrumentation', 'enabled', fallback=False) and not instrumentation_available:
+        print ('Instrumentation is enabled but the instrumentation module is not importable (add notebooks to PYTHONPATH)')
+    profiler.configure(enabled=config.getboolean('Instrumentation', 'enabled', fallback=False),
+                       trace_memory=config.getboolean('Instrumentation', 'trace_memory', fallback=False),
+                       profile=config.getboolean('Instrumentation', 'profile', fallback=False),
+                       report_dir=config.get('Instrumentation', 'report_dir', fallback='reports'))
+
     # Initialize the PEMSConnector with the configuration file
     pems = PEMSConnector("config.ini")
 
@@ -421,11 +550,20 @@ if __name__ == "__main__":
     pems._insert_data()
 
     # Create ISO timestamp column and create index on this column
-    add_iso_timestamp(pems.cursor,'station_5min','timestamp')
-    create_index(pems.cursor,'station_5min','iso_timestamp')
+    with profiler.stage('index'):
+        add_iso_timestamp(pems.cursor,'station_5min','timestamp')
+        create_index(pems.cursor,'station_5min','iso_timestamp')
+
+    # Close the validity interval of each station version in the meta table
+    with profiler.stage('meta_validity'):
+        add_meta_validity(pems.cursor)
 
     # Add weather data to the database (function from ddl module)
-    add_weather_data("config.ini", pems.conn)
+    with profiler.stage('weather'):
+        add_weather_data("config.ini", pems.conn)
 
     # Close the database connection
     pems.close_conn()
+
+    # Write the stage timings, counters and memory of this run
+    profiler.write_report('data_downloader')
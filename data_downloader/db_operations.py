@@ -66,7 +66,9 @@ def table_data():
     name TEXT,
     user_id1 TEXT,
     user_id2 TEXT,
-    user_id3 TEXT);
+    user_id3 TEXT,
+    valid_from TEXT,
+    valid_to TEXT);
     '''
 
     create_table_chp_incidents_month = '''
@@ -183,6 +185,37 @@ def create_index(cursor, table_name, column_name):
 
     return 0
 
+def add_meta_validity(cursor):
+    """
+    Closes the validity interval of every station version in the meta table.
+
+    Each meta row is inserted with valid_from set to the date of the meta file it came from.
+    This sets valid_to to the valid_from of the next version of the same station, leaving the
+    latest version open-ended (NULL), and indexes the table for point-in-time lookups.
+
+    Args:
+        cursor: A cursor object for executing SQL commands.
+
+    Returns:
+        int: Returns 0 upon successful execution.
+    """
+
+    # Index station versions by station and start of validity
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_meta_validity ON meta(freeway_id, valid_from);")
+
+    # The next version of a station starts where the current one ends
+    update_validity_sql = """UPDATE meta SET valid_to =
+                             (SELECT MIN(next_meta.valid_from) FROM meta AS next_meta
+                              WHERE next_meta.freeway_id = meta.freeway_id
+                              AND next_meta.valid_from > meta.valid_from);"""
+
+    # Execute the SQL command to close the validity intervals
+    cursor.execute(update_validity_sql)
+    cursor.connection.commit()
+    print ('Validity intervals added in table meta')
+
+    return 0
+
 def add_weather_data(config_file, conn):
     """
     Fetches weather data from an API and stores it in an SQLite database.
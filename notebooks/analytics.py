@@ -0,0 +1,215 @@
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import linkage, fcluster
+from scipy.spatial.distance import squareform
+
+# Radius of Earth in miles (mean radius)
+earth_radius_miles = 3958.8
+
+
+def station_matrix(df, column='total_flow', station='station', timestamp='iso_timestamp', data_interval_mins=5):
+    """
+    Arrange a column of the readings into a dense [time, station] array on a regular time grid.
+
+    Parameters:
+    - df: DataFrame of readings containing station and timestamp columns.
+    - column: Column to arrange.
+    - station: Column name of the station identifier.
+    - timestamp: Column name of the reading time.
+    - data_interval_mins: The interval (in minutes) between timestamps in the data.
+
+    Returns:
+    - values: Array (timesteps, stations) of float64, NaN where a reading is missing.
+    - timestamps: DatetimeIndex of the rows.
+    - stations: Array of the station identifiers of the columns (sorted).
+    """
+
+    times = pd.to_datetime(df[timestamp])
+    timestamps = pd.date_range(times.min(), times.max(), freq=f'{data_interval_mins}min')
+    stations, station_index = np.unique(df[station].to_numpy(), return_inverse=True)
+
+    # Row of each reading on the regular time grid
+    time_index = ((times - timestamps[0]) // pd.Timedelta(minutes=data_interval_mins)).to_numpy()
+
+    values = np.full((len(timestamps), len(stations)), np.nan)
+    values[time_index, station_index] = df[column].to_numpy(dtype=np.float64)
+
+    return values, timestamps, stations
+
+
+def lag_autocorrelation(values, lags, method='auto', chunk_size=256):
+    """
+    Pearson correlation of every station's series with its own lagged series, for all stations and lags together.
+    Like pandas 'corr' on shifted columns, each correlation uses only the pairs where both values are observed.
+
+    Parameters:
+    - values: Array (timesteps, stations) from 'station_matrix', NaN where a reading is missing.
+    - lags: List of lags (in timesteps).
+    - method: 'dot' computes one batched product per lag, 'fft' computes all lags at once with FFTs.
+              'auto' uses 'fft' when there are more lags than the FFT costs (log2 of the timesteps).
+    - chunk_size: Number of stations processed together, to bound memory.
+
+    Returns:
+    - correlations: Array (stations, lags), NaN where a station has fewer than two observed pairs.
+    """
+
+    lags = np.asarray(lags, dtype=np.int64)
+    num_steps, num_stations = values.shape
+    if method == 'auto':
+        method = 'fft' if len(lags) > np.log2(2 * num_steps) else 'dot'
+
+    correlations = np.full((num_stations, len(lags)), np.nan)
+    for start in range(0, num_stations, chunk_size):
+        chunk = values[:, start:start + chunk_size]
+        observed = ~np.isnan(chunk)
+
+        # Centre each station (correlation is shift invariant) and zero the missing values
+        x = np.where(observed, chunk - np.nanmean(chunk, axis=0), 0.0)
+        m = observed.astype(np.float64)
+
+        if method == 'fft':
+            sums = _lagged_sums_fft(x, m, lags)
+        else:
+            sums = _lagged_sums_dot(x, m, lags)
+
+        # Pairwise complete Pearson correlation from the lagged sums
+        count, sum_a, sum_b, sum_aa, sum_bb, sum_ab = sums
+        with np.errstate(divide='ignore', invalid='ignore'):
+            covariance = count * sum_ab - sum_a * sum_b
+            variance = (count * sum_aa - sum_a ** 2) * (count * sum_bb - sum_b ** 2)
+            correlation = covariance / np.sqrt(variance)
+        correlations[start:start + chunk_size] = np.where(count > 1, correlation, np.nan).T
+
+    return correlations
+
+
+def _lagged_sums_dot(x, m, lags):
+    # Sums over the pairs (t, t - lag) of each lag: count, a, b, a^2, b^2, a*b with a = x[t] and b = x[t - lag]
+    sums = np.zeros((6, len(lags), x.shape[1]))
+    for i, lag in enumerate(lags):
+        a, b = x[lag:], x[:len(x) - lag]
+        ma, mb = m[lag:], m[:len(m) - lag]
+        sums[:, i] = [np.einsum('ij,ij->j', ma, mb), np.einsum('ij,ij->j', a, mb), np.einsum('ij,ij->j', ma, b),
+                      np.einsum('ij,ij->j', a * a, mb), np.einsum('ij,ij->j', ma, b * b), np.einsum('ij,ij->j', a, b)]
+    return sums
+
+
+def _lagged_sums_fft(x, m, lags):
+    # Same sums as '_lagged_sums_dot', from cross-correlations computed with zero-padded FFTs
+    size = 1 << int(np.ceil(np.log2(2 * len(x))))
+    fx, fm, fxx = (np.fft.rfft(series, n=size, axis=0) for series in (x, m, x * x))
+
+    def cross(f, g):
+        # sum_t f[t] g[t - lag] for the requested lags
+        return np.fft.irfft(f * np.conj(g), n=size, axis=0)[lags]
+
+    return np.stack([cross(fm, fm), cross(fx, fm), cross(fm, fx), cross(fxx, fm), cross(fm, fxx), cross(fx, fx)])
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance (in miles) between coordinates given in degrees, for arrays of any broadcastable shape.
+    """
+
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+
+    return 2 * earth_radius_miles * np.arcsin(np.sqrt(a))
+
+
+def spatial_distances(latitude, longitude):
+    """
+    Pairwise great-circle distances (in miles) between the stations.
+
+    Parameters:
+    - latitude: Array of station latitudes (degrees).
+    - longitude: Array of station longitudes (degrees).
+
+    Returns:
+    - distances: Condensed distance vector of the N*(N-1)/2 station pairs (as used by scipy 'linkage' and 'squareform').
+    """
+
+    latitude, longitude = np.asarray(latitude, dtype=np.float64), np.asarray(longitude, dtype=np.float64)
+    i, j = np.triu_indices(len(latitude), k=1)
+
+    return haversine(latitude[i], longitude[i], latitude[j], longitude[j])
+
+
+def temporal_distances(values):
+    """
+    Pairwise correlation distances (1 - Pearson correlation) between the station series.
+    Missing values are treated as the station mean, so the whole matrix comes from one matrix product.
+
+    Parameters:
+    - values: Array (timesteps, stations) from 'station_matrix'.
+
+    Returns:
+    - distances: Condensed distance vector of the N*(N-1)/2 station pairs.
+    """
+
+    # Standardise each station, missing values become 0 (the mean)
+    std = np.nanstd(values, axis=0)
+    z = np.nan_to_num((values - np.nanmean(values, axis=0)) / np.where(std > 0, std, 1))
+    correlation = z.T @ z / len(z)
+
+    distances = np.clip(1 - correlation, 0, 2)
+    np.fill_diagonal(distances, 0)
+
+    return squareform(distances, checks=False)
+
+
+def cluster_stations(distances, num_clusters=None, threshold=None, method='average'):
+    """
+    Hierarchical clustering of the stations from a condensed distance vector.
+
+    Parameters:
+    - distances: Condensed distance vector, e.g. from 'spatial_distances' or 'temporal_distances'.
+    - num_clusters: Optional, number of flat clusters to form.
+    - threshold: Optional, distance at which to cut the tree (used when num_clusters is not given).
+    - method: Linkage method for precomputed distances ('average', 'complete' or 'single').
+
+    Returns:
+    - linked: Linkage matrix.
+    - labels: Flat cluster label of each station (None if neither num_clusters nor threshold is given).
+    """
+
+    linked = linkage(distances, method=method)
+
+    labels = None
+    if num_clusters is not None:
+        labels = fcluster(linked, num_clusters, criterion='maxclust')
+    elif threshold is not None:
+        labels = fcluster(linked, threshold, criterion='distance')
+
+    return linked, labels
+
+
+def linkage_table(linked, labels):
+    """
+    Describe each merge of a linkage matrix without building the member lists of every cluster.
+
+    Parameters:
+    - linked: Linkage matrix from scipy 'linkage'.
+    - labels: Station identifier of each observation used for the linkage.
+
+    Returns:
+    - linkage_df: DataFrame with one row per merge: the merged cluster ids, their sizes, the station of
+                  single-station clusters (NaN otherwise), the merge distance and the number of observations.
+    """
+
+    labels = np.asarray(labels)
+    num_labels = len(labels)
+    clusters = linked[:, :2].astype(np.int64)
+
+    # Size of each cluster id: observations are singletons, merged clusters take their size from the linkage
+    sizes = np.concatenate([np.ones(num_labels), linked[:, 3]])
+
+    linkage_df = pd.DataFrame({'cluster1': clusters[:, 0], 'cluster2': clusters[:, 1],
+                               'cluster1_size': sizes[clusters[:, 0]].astype(int), 'cluster2_size': sizes[clusters[:, 1]].astype(int),
+                               'distance': linked[:, 2], 'num_observations': linked[:, 3].astype(int)})
+
+    for column, cluster in (('station1', clusters[:, 0]), ('station2', clusters[:, 1])):
+        singleton = cluster < num_labels
+        linkage_df[column] = pd.Series(labels[np.where(singleton, cluster, 0)]).where(singleton).convert_dtypes()
+
+    return linkage_df
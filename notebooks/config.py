@@ -7,6 +7,12 @@ class Config():
     db_path = 'ADD_DATABASE_PATH' # add your database path
     osrm_path = 'http://router.project-osrm.org/route/v1/driving/'
 
+    # Instrumentation: stage timers, counters and memory written to a JSON run report (no overhead when disabled)
+    instrumentation = False
+    trace_memory = False # peak Python allocations of each stage with tracemalloc (slower)
+    cprofile = False # profile the whole run with cProfile
+    report_dir = 'reports'
+
     # Data Reduction Conditions
     # Station boundary region condition (filter-region): List of station IDs
     station_range = [1212741, 1203252, 1205139]
@@ -22,6 +28,10 @@ class Config():
 
     # Train size: Fraction of data to be used for training
     train_size = 0.8 
+
+    # Window construction: fill method for missing values ('ffill', 'seasonal' or 'zero') and season length in timesteps
+    fill_method = 'ffill'
+    seasonal_lag = 2016 # one week of 5-minute intervals
     
 
     def create_y_range(pred_hour=0, y_ts_step=1):
@@ -93,6 +103,18 @@ class Config():
     # Transformer model configuration 
     grid_tf_head = 8 # for Grid type 
     graph_tf_nhead = 8 # for Graph type
+
+    # Subgraph training configuration (district scale, Graph type only)
+    subgraph_training = False # train on station clusters with a node-wise prediction head
+    subgraph_cluster_size = 50 # maximum number of stations in a cluster
+    subgraph_num_hops = 1 # neighbourhood hops added around each cluster
+
+    # Backtesting configuration (rolling/expanding origin folds over the time axis)
+    backtest_folds = 4 # number of folds
+    backtest_test_size = 1008 # test samples per fold (half a week of 5-minute intervals, so 4 folds fit in one month of data)
+    backtest_mode = 'expanding' # 'expanding' keeps all earlier samples for training, 'rolling' keeps a fixed-size window
+    backtest_gap = None # samples skipped between the training and test sets of a fold (None: the largest horizon step, so no training target falls in the test period)
+    backtest_workers = 4 # worker processes, each training one (fold, model) pair at a time
     
 
     
@@ -117,6 +139,10 @@ class Config():
 
         # Number of attention heads for Graph Convolutional Networks (GCN) and Graph Attention Networks (GAT)
         graph_layer_heads = 4    
+
+        # Node-wise head predicts each station separately, otherwise all stations are predicted together
+        node_wise = kwargs.get('node_wise', False)
+        linear_out_features = output_channels if node_wise else num_stations * output_channels
         
         if model_type == 'Grid':
             # Model configuration for Grid-based architecture
@@ -125,7 +151,7 @@ class Config():
                 dict(layer_no=1, model='CNN', in_channels=1, kernel_size=kwargs['cnn_filter_size'], stride=kwargs['cnn_stride'], out_channels=kwargs['cnn_out_channels']),
                 dict(layer_no=1, model='CNN', in_channels=1, kernel_size=kwargs['cnn_filter_size'], stride=kwargs['cnn_stride'], out_channels=kwargs['cnn_out_channels']),
                 dict(layer_no=2, model='Transformer', nhead=kwargs['grid_tf_head'], num_encoder_layers=1, num_decoder_layers=1),
-                dict(layer_no=3, model='Linear', out_features= num_stations * output_channels)
+                dict(layer_no=3, model='Linear', out_features=linear_out_features, node_wise=node_wise)
             ]}
         else:
             # Model configuration for Graph-based architectures (GCN and GAT)
@@ -134,13 +160,13 @@ class Config():
                 dict(layer_no=1, model='GCN', out_channels=kwargs['hidden_channels']),
                 dict(layer_no=1, model='GCN', out_channels=kwargs['hidden_channels']),
                 dict(layer_no=2, model='Transformer', d_model=kwargs['hidden_channels'] * 2, nhead=kwargs['graph_tf_nhead'], num_encoder_layers=1, num_decoder_layers=1),
-                dict(layer_no=3, model='Linear', in_features=kwargs['hidden_channels'] * 2, out_features=num_stations * output_channels)
+                dict(layer_no=3, model='Linear', in_features=kwargs['hidden_channels'] * 2, out_features=linear_out_features, node_wise=node_wise)
             ],
             'GAT': [
                 dict(layer_no=1, model='GAT', heads=graph_layer_heads, out_channels=kwargs['hidden_channels']),
                 dict(layer_no=1, model='GAT', heads=graph_layer_heads, out_channels=kwargs['hidden_channels']),
                 dict(layer_no=2, model='Transformer', d_model=kwargs['hidden_channels'] * graph_layer_heads * 2, nhead=kwargs['graph_tf_nhead'], num_encoder_layers=1, num_decoder_layers=1),
-                dict(layer_no=3, model='Linear', in_features=kwargs['hidden_channels'] * graph_layer_heads * 2, out_features=num_stations * output_channels)
+                dict(layer_no=3, model='Linear', in_features=kwargs['hidden_channels'] * graph_layer_heads * 2, out_features=linear_out_features, node_wise=node_wise)
             ]
                 }
             
\ No newline at end of file
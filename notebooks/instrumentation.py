@@ -0,0 +1,240 @@
+import os
+import sys
+import io
+import json
+import time
+import uuid
+import cProfile
+import pstats
+import tracemalloc
+import functools
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+try:
+    import resource # Unix only, used for the peak resident memory
+except ImportError:
+    resource = None
+
+# Shared no-op context returned by 'stage' when instrumentation is disabled
+null_stage = nullcontext()
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory (in MB) of the process so far, None where it is not available.
+    """
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_mb():
+    """
+    Current resident memory (in MB) of the process, None where it is not available.
+    """
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Profiler:
+    def __init__(self, enabled=False, trace_memory=False, profile=False, report_dir='reports', top_functions=30):
+        """
+        Stage-level instrumentation of a pipeline run: timers, counters, memory and an optional cProfile capture.
+        When disabled, 'stage' returns a shared no-op context and 'count' returns immediately.
+
+        Parameters:
+        - enabled: If True, stages and counters are recorded.
+        - trace_memory: If True, the peak traced allocations of each stage (and their increase over the start of the stage)
+                        are recorded with tracemalloc (slower).
+        - profile: If True, the whole run is profiled with cProfile and the top functions are added to the report.
+        - report_dir: Directory in which the JSON run reports are written.
+        - top_functions: Number of functions (by cumulative time) kept from the cProfile capture.
+        """
+
+        self.enabled = False
+        self.configure(enabled, trace_memory, profile, report_dir, top_functions)
+
+    def configure(self, enabled=False, trace_memory=False, profile=False, report_dir='reports', top_functions=30):
+        """
+        (Re)start a run with the given settings, discarding the stages and counters recorded so far.
+        """
+
+        self._stop_capture()
+        self.enabled, self.trace_memory, self.profile = enabled, enabled and trace_memory, enabled and profile
+        self.report_dir, self.top_functions = report_dir, top_functions
+
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = datetime.now()
+        self.start_time = time.perf_counter()
+        self.stages, self.counters = {}, {}
+        self._stack = [] # Stages currently open, outermost first
+        self._profiler = None
+
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+        return self
+
+    def stage(self, name):
+        """
+        Context manager timing a pipeline stage. Nested stages are recorded under 'outer/inner'.
+
+        Parameters:
+        - name: Name of the stage.
+        """
+
+        if not self.enabled:
+            return null_stage
+        return self._record(name)
+
+    @contextmanager
+    def _record(self, name):
+        path = '/'.join([frame['path'] for frame in self._stack[-1:]] + [name])
+        frame = {'path': path, 'peak': 0, 'start': 0}
+
+        if self.trace_memory:
+            # Keep the peak reached so far by the enclosing stage, then measure this stage from zero
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            frame['start'] = tracemalloc.get_traced_memory()[0]
+
+        self._stack.append(frame)
+        start_time = time.perf_counter()
+        try:
+            yield frame
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self._stack.pop()
+
+            stats = self.stages.setdefault(path, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            stats['calls'] += 1
+            stats['seconds'] += elapsed
+            stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+            stats['peak_rss_mb'] = peak_rss_mb()
+
+            if self.trace_memory:
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                stats['peak_traced_mb'] = max(stats.get('peak_traced_mb', 0.0), peak / 1024 ** 2)
+                stats['peak_traced_increase_mb'] = max(stats.get('peak_traced_increase_mb', 0.0), (peak - frame['start']) / 1024 ** 2)
+                if self._stack:
+                    self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+
+    def timed(self, name=None):
+        """
+        Decorator timing every call of a function as a stage (named after the function by default).
+        """
+
+        def decorator(function):
+            stage_name = name or function.__name__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self._record(stage_name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def count(self, name, value=1):
+        """
+        Add value to a counter (e.g. rows, samples or requests). Counters are kept per run, not per stage.
+        """
+
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self):
+        """
+        Build the run report.
+
+        Returns:
+        - report: Dictionary with the run details, stages (calls, seconds, peak memory), counters and top profiled functions.
+        """
+
+        report = {
+            'run_id': self.run_id,
+            'started': self.started.isoformat(timespec='seconds'),
+            'seconds': time.perf_counter() - self.start_time,
+            'python': sys.version.split()[0],
+            'pid': os.getpid(),
+            'peak_rss_mb': peak_rss_mb(),
+            'current_rss_mb': current_rss_mb(),
+            'stages': self.stages,
+            'counters': self.counters,
+        }
+
+        if self.trace_memory:
+            report['peak_traced_mb'] = max([stats['peak_traced_mb'] for stats in self.stages.values()] + [tracemalloc.get_traced_memory()[1] / 1024 ** 2])
+
+        if self._profiler is not None:
+            report['profile'] = self._profile_summary()
+
+        return report
+
+    def _profile_summary(self):
+        # Top functions of the cProfile capture by cumulative time
+        self._profiler.disable()
+        stats = pstats.Stats(self._profiler, stream=io.StringIO())
+        self._profiler.enable()
+
+        functions = []
+        for (file_name, line, function), (_, calls, total, cumulative, _) in stats.stats.items():
+            functions.append({'function': f'{os.path.basename(file_name)}:{line}({function})', 'calls': calls,
+                              'total_seconds': total, 'cumulative_seconds': cumulative})
+
+        return sorted(functions, key=lambda item: item['cumulative_seconds'], reverse=True)[:self.top_functions]
+
+    def write_report(self, name='pipeline'):
+        """
+        Write the run report as JSON (and the raw cProfile stats if profiling) to report_dir.
+
+        Parameters:
+        - name: Name of the pipeline, used as the file name prefix.
+
+        Returns:
+        - report_path: Path of the JSON report, None when disabled.
+        """
+
+        if not self.enabled:
+            return None
+
+        os.makedirs(self.report_dir, exist_ok=True)
+        file_name = f"{name}_{self.started:%Y%m%d_%H%M%S}_{self.run_id}"
+        report = {'name': name, **self.report()}
+
+        if self._profiler is not None:
+            self._profiler.dump_stats(os.path.join(self.report_dir, file_name + '.prof'))
+
+        report_path = os.path.join(self.report_dir, file_name + '.json')
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+
+        print ('Run report written to', report_path)
+        return report_path
+
+    def _stop_capture(self):
+        # Stop the memory tracing and profiling of the previous run
+        if getattr(self, 'trace_memory', False) and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        if getattr(self, '_profiler', None) is not None:
+            self._profiler.disable()
+
+
+# Instrumentation shared by the pipeline (disabled until configured)
+profiler = Profiler()
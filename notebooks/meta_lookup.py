@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import take
+
+# Station attributes that change over time and are attached to the traffic readings
+meta_columns = ['lanes', 'type', 'latitude', 'longitude']
+
+
+def load_meta_versions(conn, columns=meta_columns):
+    """
+    Load all versions of the station metadata along with their validity intervals.
+
+    Parameters:
+    - conn: A connection object to the SQLite database.
+    - columns: Station attributes to load.
+
+    Returns:
+    - meta_versions: DataFrame with one row per station version, sorted by station and valid_from.
+    """
+
+    query = "SELECT freeway_id, valid_from, valid_to, " + ', '.join(columns) + " FROM meta ORDER BY freeway_id, valid_from"
+    meta_versions = pd.read_sql_query(query, conn)
+
+    # Convert the validity interval into datetimes (open-ended versions have no valid_to)
+    meta_versions['valid_from'] = pd.to_datetime(meta_versions['valid_from'])
+    meta_versions['valid_to'] = pd.to_datetime(meta_versions['valid_to'])
+
+    return meta_versions
+
+
+def asof_join_meta(df, meta_versions, columns=meta_columns, station='station', timestamp='iso_timestamp',
+                   station_key='freeway_id', fill_before_first=True):
+    """
+    Attach to each reading the station attributes that were valid at the time of the reading.
+
+    Instead of a pandas merge, every (station, timestamp) pair is encoded into a single sortable
+    integer key, and the matching version is found with one binary search over the sorted versions.
+
+    Parameters:
+    - df: DataFrame of readings containing station and timestamp columns.
+    - meta_versions: DataFrame of station versions, as returned by 'load_meta_versions'.
+    - columns: Station attributes to attach.
+    - station: Column name of the station identifier in df.
+    - timestamp: Column name of the reading time in df.
+    - station_key: Column name of the station identifier in meta_versions.
+    - fill_before_first: If True, readings older than the first version of a station get that first version.
+
+    Returns:
+    - df: Copy of df with the attribute columns attached (NaN where the station has no version).
+    """
+
+    # Sort the versions by station and start of validity
+    meta_versions = meta_versions.sort_values([station_key, 'valid_from'])
+    version_station = meta_versions[station_key].to_numpy(dtype=np.int64)
+    version_time = pd.to_datetime(meta_versions['valid_from']).to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+    reading_station = df[station].to_numpy(dtype=np.int64)
+    reading_time = pd.to_datetime(df[timestamp]).to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+    # Map station identifiers to dense codes, unknown stations are flagged
+    stations = np.unique(version_station)
+    version_code = np.searchsorted(stations, version_station)
+    reading_code = np.searchsorted(stations, reading_station)
+    reading_code = np.minimum(reading_code, len(stations) - 1)
+    known = stations[reading_code] == reading_station
+
+    # Encode (station, time) into one key: versions are then sorted by key
+    time_origin = min(version_time.min(), reading_time.min())
+    time_span = max(version_time.max(), reading_time.max()) - time_origin + 1
+    version_key = version_code * time_span + (version_time - time_origin)
+    reading_key = reading_code * time_span + (reading_time - time_origin)
+
+    # Latest version starting at or before the reading time
+    index = np.searchsorted(version_key, reading_key, side='right') - 1
+    matched = (index >= 0) & (version_code[np.maximum(index, 0)] == reading_code)
+
+    if fill_before_first:
+        # Readings before the first version of a station use the first version
+        first_index = np.searchsorted(version_code, reading_code, side='left')
+        index = np.where(matched, index, first_index)
+    else:
+        index = np.where(matched, index, -1)
+    index = np.where(known, index, -1)
+
+    # Gather the attributes of the matched versions (-1 gives NaN)
+    df = df.copy()
+    for column in columns:
+        df[column] = take(meta_versions[column].to_numpy(), index, allow_fill=True)
+
+    return df